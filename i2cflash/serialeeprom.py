@@ -19,13 +19,34 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from array import array
 from logging import getLogger
-from re import match
+from re import compile as re_compile, IGNORECASE
 from time import sleep, time as now
-from typing import Iterable, Union
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional, Tuple, Union
 from pyftdi.i2c import I2cController, I2cPort
 
 
+_EEPROM_NAME_RE = re_compile(r'^24AA(?P<size>\d+)(?P<rev>[a-z]?)$', IGNORECASE)
+
+# EEPROM capacity in bytes: (page size in bytes, address width in bytes)
+_DEVICES = MappingProxyType({
+    128: (8, 1),
+    256: (8, 1),
+    # the following devices require shifting slave addresses:
+    # not yet implemented
+    # 512: (16, 1),
+    # 1 << 10: (16, 1),
+    # 2 << 10: (16, 1),
+    4 << 10: (32, 2),
+    8 << 10: (32, 2),
+    16 << 10: (64, 2),
+    32 << 10: (64, 2),
+    64 << 10: (128, 2),
+})  # type: Mapping[int, Tuple[int, int]]
+
+
 class SerialEepromError(Exception):
     """Base class for all Serial Flash errors"""
 
@@ -62,41 +83,57 @@ class SerialEepromManager:
 
     @staticmethod
     def get_from_controller(i2cctrl: I2cController,
-                            name: str, address: int = 0x50) -> SerialEeprom:
+                            name: str, address: int = 0x50,
+                            write_cycle_time: Optional[float] = None,
+                            write_poll_interval: Optional[float] = None) \
+            -> SerialEeprom:
         """Obtain an instance of the detected flash device, using an
            existing SpiController.
 
            :param i2cctrl: a PyFtdi configured I2cController instance
            :param name: I2C EEPROM type
            :param address: I2C slave address
+           :param write_cycle_time: maximum time to wait for a page write,
+                                    see :py:class:`I2c24AADevice`
+           :param write_poll_interval: delay between two polls of the device,
+                                       see :py:class:`I2c24AADevice`
            :return: a concrete :py:class:`SerialEeprom` instance
         """
         size = SerialEepromManager.get_eeprom_size(name, address)
         slave = i2cctrl.get_port(address)
-        flash = I2c24AADevice(slave, size)
+        flash = I2c24AADevice(slave, size, write_cycle_time,
+                              write_poll_interval)
         return flash
 
     @staticmethod
     def get_flash_device(url: str, name: str, address: int = 0x50,
-                         highspeed: bool = False) -> SerialEeprom:
+                         highspeed: bool = False,
+                         write_cycle_time: Optional[float] = None,
+                         write_poll_interval: Optional[float] = None) \
+            -> SerialEeprom:
         """Obtain an instance of the detected flash device.
 
            :param url: FTDI url
            :param name: I2C EEPROM type
            :param address: I2C slave address
            :param highspeed: whether to use a 400 KHz vs. 100 KHz clock
+           :param write_cycle_time: maximum time to wait for a page write,
+                                    see :py:class:`I2c24AADevice`
+           :param write_poll_interval: delay between two polls of the device,
+                                       see :py:class:`I2c24AADevice`
            :return: a concrete :py:class:`SerialEeprom` instance
         """
         size = SerialEepromManager.get_eeprom_size(name, address)
         ctrl = I2cController()
         ctrl.configure(url, frequency=highspeed and 400E3 or 100E3)
         slave = ctrl.get_port(address)
-        flash = I2c24AADevice(slave, size)
+        flash = I2c24AADevice(slave, size, write_cycle_time,
+                              write_poll_interval)
         return flash
 
     @staticmethod
     def get_eeprom_size(name: str, address: int) -> int:
-        mo = match(r'(?i)^24AA(?P<size>\d+)(?P<rev>[a-z]?)$', name)
+        mo = _EEPROM_NAME_RE.match(name)
         if not mo:
             raise SerialEepromValueError('Unsupported type: %s' % name)
         size = int(mo.group('size')) << (10-3)
@@ -119,31 +156,51 @@ class I2c24AADevice(SerialEeprom):
 
     WRITE_CYCLE_TIME_MAX = 0.005
 
-    DEVICES = {
-        128: (8, 1),
-        256: (8, 1),
-        # the following devices require shifting slave addresses:
-        # not yet implemented
-        # 512: (16, 1),
-        # 1 << 10: (16, 1),
-        # 2 << 10: (16, 1),
-        4 << 10: (32, 2),
-        8 << 10: (32, 2),
-        16 << 10: (64, 2),
-        32 << 10: (64, 2),
-        64 << 10: (128, 2),
-    }
-
-    def __init__(self, slave: I2cPort, size: int):
+    WRITE_POLL_INTERVAL = 200e-6
+
+    _MAX_READ_CHUNK = 4096
+
+    DEVICES = _DEVICES
+
+    def __init__(self, slave: I2cPort, size: int,
+                 write_cycle_time: Optional[float] = None,
+                 write_poll_interval: Optional[float] = None):
+        """
+           :param slave: the I2C port of the EEPROM device
+           :param size: EEPROM capacity in bytes
+           :param write_cycle_time: maximum time to wait for the device to
+                                    complete a page write, in seconds.
+                                    Defaults to four times the datasheet
+                                    maximum write cycle time, as each poll
+                                    of the device costs about 1 ms of USB
+                                    latency; the write completes as soon
+                                    as the device acknowledges a poll.
+           :param write_poll_interval: delay between two polls of the
+                                       device while a page write is in
+                                       progress, in seconds. Zero
+                                       busy-polls the device.
+        """
+        if write_cycle_time is None:
+            write_cycle_time = self.WRITE_CYCLE_TIME_MAX*4
+        if write_poll_interval is None:
+            write_poll_interval = self.WRITE_POLL_INTERVAL
+        if write_cycle_time < 0:
+            raise SerialEepromValueError('Invalid write cycle time: %s' %
+                                         write_cycle_time)
+        if write_poll_interval < 0:
+            raise SerialEepromValueError('Invalid write poll interval: %s' %
+                                         write_poll_interval)
         self.log = getLogger('pyftdi.i2c.eeprom')
         self._slave = slave
-        try:
-            self._cache_size, self._addr_width = self.DEVICES[size]
-        except KeyError:
+        entry = _DEVICES.get(size)
+        if entry is None:
             raise SerialEepromValueError('Unsupported flash size: %d KiB' %
                                          size)
+        self._cache_size, self._addr_width = entry
         self._size = size
         self._cache_mask = self._cache_size-1
+        self._write_cycle_time = write_cycle_time
+        self._write_poll_interval = write_poll_interval
         self._slave.configure_register(True, self._addr_width)
 
     @classmethod
@@ -152,11 +209,11 @@ class I2c24AADevice(SerialEeprom):
 
            :return: word size in bytes.
         """
-        try:
-            return cls.DEVICES[size][1]
-        except KeyError:
+        entry = _DEVICES.get(size)
+        if entry is None:
             raise SerialEepromValueError('Unsupported flash size: %d KiB' %
                                          size)
+        return entry[1]
 
     @property
     def capacity(self) -> int:
@@ -178,49 +235,77 @@ class I2c24AADevice(SerialEeprom):
         """
         if address+size > len(self):
             raise SerialEepromValueError('Out of range')
-        # although it should not be necessary, it seems that reading out
-        # all bytes at once triggers errors - reason unknown
-        # read out reliability is greatly improved with short read sequence
-        # we use the same chunk management as with write request to
-        # align as much read requests as possible on device pages
-        self.log.info('Read @ 0x%04x', address)
-        return self._slave.read_from(address, size)
+        # reading out the whole device at once may trigger errors with
+        # large requests: split them into FTDI-friendly chunks, which are
+        # far larger than device pages
+        self.log.debug('Read @ 0x%04x %d bytes', address, size)
+        chunk = self._MAX_READ_CHUNK
+        if size <= chunk:
+            return bytes(self._slave.read_from(address, size))
+        read_from = self._slave.read_from
+        buf = bytearray(size)
+        mbuf = memoryview(buf)
+        for offset in range(0, size, chunk):
+            length = min(chunk, size-offset)
+            mbuf[offset:offset+length] = read_from(address+offset, length)
+        return bytes(buf)
 
     def write(self, address: int,
-              data: Union[bytes, bytearray, Iterable[int]]) -> None:
+              data: Union[bytes, bytearray, memoryview,
+                          Iterable[int]]) -> None:
         """Write data to SerialEeprom.
 
            :param int: address of the first byte to write in SerialEeprom
            :param data: data buffer to write
         """
-        if not isinstance(data, (bytes, bytearray)):
-            data = bytes(data)
-        if address+len(data) > len(self):
+        # buffer-like objects are sliced in place, without any copy
+        if isinstance(data, (bytes, bytearray)) or \
+                (isinstance(data, memoryview) and data.c_contiguous) or \
+                (isinstance(data, array) and data.typecode == 'B'):
+            mdata = memoryview(data).cast('B')
+        else:
+            mdata = memoryview(bytes(data))
+        if address+len(mdata) > len(self):
             raise SerialEepromValueError('Out of range')
-        size = len(data)
         # unaligned left hand side
         left = address & self._cache_mask
-        csize = self._cache_size
         if left:
-            length = csize - left
-            self._do_write(address, data[:length])
-            offset = length
+            length = min(self._cache_size - left, len(mdata))
+            self._do_write(address, mdata[:length])
             address += length
-        else:
-            offset = 0
+            mdata = mdata[length:]
         # aligned buffer
-        while offset < size:
-            wsize = min(csize, size-offset)
-            self._do_write(address, data[offset:offset+wsize])
-            address += wsize
-            offset += wsize
+        if mdata:
+            self._do_write_stream(address, mdata)
+
+    def _do_write_stream(self, address: int, data: memoryview) -> None:
+        # a page write wraps around within the device page, so each page
+        # needs its own write sequence; ACK polling keeps the gap between
+        # two consecutive pages as short as the device allows
+        csize = self._cache_size
+        do_write = self._do_write
+        for offset in range(0, len(data), csize):
+            do_write(address+offset, data[offset:offset+csize])
 
     def _do_write(self, address, data):
-        self.log.info('Write @ 0x%04x %s', address, data)
+        self.log.debug('Write @ 0x%04x %d bytes', address, len(data))
         self._slave.write_to(address, data)
-        last = now() + self.WRITE_CYCLE_TIME_MAX*4
+        self._wait_write_cycle()
+
+    def _wait_write_cycle(self) -> None:
+        # the device does not acknowledge its address while the internal
+        # write cycle is in progress: poll it rather than waiting for the
+        # worst case write cycle time
+        poll = self._slave.poll
+        interval = self._write_poll_interval
+        last = now() + self._write_cycle_time
         while now() < last:
-            sleep(self.WRITE_CYCLE_TIME_MAX*4)
-            break
+            if poll(write=True):
+                break
+            if interval:
+                sleep(interval)
         else:
+            # last chance, as the deadline may have elapsed while sleeping
+            if poll(write=True):
+                return
             raise SerialEepromTimeout('Device did not complete write cycle')
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+# Copyright (c) 2017-2020, Emmanuel Blot <emmanuel.blot@free.fr>
+# All rights reserved.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import unittest
+from array import array
+from i2cflash.serialeeprom import (I2c24AADevice, SerialEepromTimeout,
+                                   SerialEepromValueError)
+
+#pylint: disable-msg=missing-docstring
+
+
+class I2cPortStub:
+    """Emulate a 24AA EEPROM behind a PyFtdi I2cPort, without hardware."""
+
+    def __init__(self, size, page_size, busy_polls=0):
+        self.memory = bytearray(size)
+        self.page_size = page_size
+        self.busy_polls = busy_polls
+        self.writes = []
+        self.reads = []
+        self.polls = []
+        self._busy = 0
+
+    def configure_register(self, bigendian, width):
+        pass
+
+    def write_to(self, regaddr, out, relax=True, start=True):
+        out = bytes(out)
+        self.writes.append((regaddr, len(out)))
+        # a page write wraps around within the device page
+        base = regaddr & ~(self.page_size-1)
+        for pos, byte in enumerate(out):
+            self.memory[base+(regaddr+pos-base) % self.page_size] = byte
+        self._busy = self.busy_polls
+
+    def read_from(self, regaddr, readlen=0, relax=True, start=True):
+        self.reads.append((regaddr, readlen))
+        return bytes(self.memory[regaddr:regaddr+readlen])
+
+    def poll(self, write=False, relax=True, start=True):
+        self.polls.append((write, relax))
+        if self._busy:
+            self._busy -= 1
+            return False
+        return True
+
+
+class NeverReadyPortStub(I2cPortStub):
+
+    def poll(self, write=False, relax=True, start=True):
+        super().poll(write, relax, start)
+        return False
+
+
+class SerialEepromStubTestCase(unittest.TestCase):
+
+    SIZE = 4 << 10
+    PAGE = 32
+
+    def _device(self, port=None, **kwargs):
+        if port is None:
+            port = I2cPortStub(self.SIZE, self.PAGE)
+        kwargs.setdefault('write_poll_interval', 0)
+        return port, I2c24AADevice(port, self.SIZE, **kwargs)
+
+    def _check_pages(self, port):
+        for address, length in port.writes:
+            self.assertLessEqual((address % self.PAGE) + length, self.PAGE,
+                                 'Write crosses a page boundary')
+
+    def test_poll_ready(self):
+        port, dev = self._device(I2cPortStub(self.SIZE, self.PAGE,
+                                             busy_polls=3))
+        dev.write(0, b'\x55')
+        self.assertEqual(len(port.polls), 4)
+        # ACK polling should use the write control byte and release the bus
+        self.assertTrue(all(w and r for w, r in port.polls))
+
+    def test_poll_last_chance(self):
+        # deadline elapses before the loop runs, the final poll should
+        # still detect the completed write cycle
+        port, dev = self._device(write_cycle_time=0)
+        dev.write(0, b'\x55')
+        self.assertEqual(len(port.polls), 1)
+
+    def test_poll_timeout(self):
+        port, dev = self._device(NeverReadyPortStub(self.SIZE, self.PAGE),
+                                 write_cycle_time=0.002)
+        self.assertRaises(SerialEepromTimeout, dev.write, 0, b'\x55')
+
+    def test_invalid_timing(self):
+        port = I2cPortStub(self.SIZE, self.PAGE)
+        self.assertRaises(SerialEepromValueError, I2c24AADevice, port,
+                          self.SIZE, write_cycle_time=-1)
+        self.assertRaises(SerialEepromValueError, I2c24AADevice, port,
+                          self.SIZE, write_poll_interval=-1)
+
+    def test_write_unaligned(self):
+        port, dev = self._device()
+        data = bytes(range(200))
+        dev.write(0x34, data)
+        self._check_pages(port)
+        self.assertEqual(port.writes[0], (0x34, self.PAGE-(0x34 % self.PAGE)))
+        self.assertEqual(bytes(port.memory[0x34:0x34+len(data)]), data)
+
+    def test_write_short(self):
+        port, dev = self._device()
+        dev.write(0x41, b'abc')
+        self.assertEqual(port.writes, [(0x41, 3)])
+        self.assertEqual(bytes(port.memory[0x41:0x44]), b'abc')
+
+    def test_write_aligned(self):
+        port, dev = self._device()
+        data = bytes(range(3*self.PAGE))
+        dev.write(self.PAGE, data)
+        self._check_pages(port)
+        self.assertEqual(port.writes, [(self.PAGE*n, self.PAGE)
+                                       for n in range(1, 4)])
+        self.assertEqual(bytes(port.memory[self.PAGE:4*self.PAGE]), data)
+
+    def test_write_buffers(self):
+        ref = bytes(range(100))
+        buffers = (memoryview(ref),
+                   memoryview(b'\xff' + ref)[1:],
+                   array('B', ref),
+                   memoryview(bytearray(ref)).cast('B', (10, 10)),
+                   iter(ref))
+        for buf in buffers:
+            port, dev = self._device()
+            dev.write(0x10, buf)
+            self._check_pages(port)
+            self.assertEqual(bytes(port.memory[0x10:0x10+len(ref)]), ref)
+
+    def test_write_strided_buffer(self):
+        # non contiguous views cannot be cast, and should be copied
+        ref = bytes(range(64))
+        port, dev = self._device()
+        dev.write(0, memoryview(ref)[::2])
+        self.assertEqual(bytes(port.memory[:32]), ref[::2])
+
+    def test_write_fortran_buffer(self):
+        # Fortran ordered views cannot be cast, and should be copied
+        try:
+            from numpy import arange, uint8
+        except ImportError:
+            self.skipTest('NumPy is required to build a Fortran buffer')
+        fortran = memoryview(arange(6, dtype=uint8).reshape(2, 3).T)
+        self.assertFalse(fortran.c_contiguous)
+        self.assertTrue(fortran.contiguous)
+        port, dev = self._device()
+        dev.write(0, fortran)
+        self.assertEqual(bytes(port.memory[:6]), bytes(fortran))
+
+    def test_write_out_of_range(self):
+        port, dev = self._device()
+        self.assertRaises(SerialEepromValueError, dev.write,
+                          self.SIZE-1, b'ab')
+        self.assertEqual(port.writes, [])
+
+    def test_read_chunks(self):
+        chunk = I2c24AADevice._MAX_READ_CHUNK
+        size = 64 << 10
+        port = I2cPortStub(size, 128)
+        port.memory[:] = bytes(n & 0xff for n in range(size))
+        dev = I2c24AADevice(port, size)
+        for length, count in ((chunk, 1), (chunk+1, 2),
+                              (3*chunk, 3), (3*chunk+7, 4)):
+            port.reads.clear()
+            data = dev.read(5, length)
+            self.assertEqual(len(port.reads), count)
+            self.assertTrue(all(l <= chunk for _, l in port.reads))
+            self.assertIsInstance(data, bytes)
+            self.assertEqual(data, bytes(port.memory[5:5+length]))
+
+
+def suite():
+    return unittest.makeSuite(SerialEepromStubTestCase, 'test')
+
+
+def main():
+    unittest.main(defaultTest='suite')
+
+
+if __name__ == '__main__':
+    main()